@@ -19,7 +19,10 @@ setuptools.setup(
     package_dir={
         '': 'src'
     },
-    install_requires=['numpy', 'spacy'],
+    install_requires=['numpy>=1.17'],
+    extras_require={
+        'numba': ['numba>=0.56'],
+    },
     include_package_data=True,  # forces inclusion of files in MANIFEST.in
     classifiers=[
         "Programming Language :: Python :: 3",
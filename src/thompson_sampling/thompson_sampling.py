@@ -7,6 +7,108 @@
 
 import numpy as np
 
+try:
+    import numba
+except ImportError:  # numba is optional: without it experiments run in pure Python
+    numba = None
+
+# number of samples of each posterior distribution drawn at once, and consumed over the following steps
+BETA_CACHE_SIZE = 64
+
+# when both alpha and beta exceed this value, Beta distributions are sampled with their normal approximation
+NORMAL_APPROX_THRESHOLD = 50.
+
+
+def _run_kernel(success_probs: np.ndarray,
+                alpha_totals: np.ndarray,
+                beta_totals: np.ndarray,
+                alpha_damping: float,
+                beta_damping: float,
+                optimistic: bool,
+                optimistic_threshold: float,
+                rng: np.random.Generator,
+                choice_log: np.ndarray,
+                reward_log: np.ndarray) -> None:
+    """
+    Main loop of a TS experiment, compiled with numba when available.
+    The posterior parameters alpha_totals and beta_totals are updated in place,
+    and the progression of the experiment is written in the step logs.
+    :param success_probs: the success probability of each bandit
+    :param alpha_totals: the alpha parameter of the posterior distribution of each bandit
+    :param beta_totals: the beta parameter of the posterior distribution of each bandit
+    :param alpha_damping: the increment of alpha after each success
+    :param beta_damping: the increment of beta after each failure
+    :param optimistic: whether to use an optimistic TS strategy
+    :param optimistic_threshold: the lower bound for sampling in an optimistic strategy
+    :param rng: the random number generator, advanced in place
+    :param choice_log: output array of length steps, the bandit drawn at each step
+    :param reward_log: output array of length steps, the reward (0/1) obtained at each step
+    """
+    n_bandits = len(success_probs)
+    thetas = np.empty(n_bandits)
+
+    for t in range(len(choice_log)):
+        # randomly sample posterior distributions for each bandit
+        for k in range(n_bandits):
+            a = alpha_totals[k]
+            b = beta_totals[k]
+            if min(a, b) > NORMAL_APPROX_THRESHOLD:
+                theta = a / (a + b) + np.sqrt(a * b / ((a + b) ** 2 * (a + b + 1))) * rng.standard_normal()
+                thetas[k] = min(max(theta, 0.), 1.)
+            else:
+                thetas[k] = rng.beta(a, b)
+        # pick bandit with max probability (with an optimistic strategy, samples are never below the threshold)
+        bandit = np.argmax(thetas)
+        if optimistic and thetas[bandit] <= optimistic_threshold:
+            bandit = 0
+        # draw from it
+        choice_log[t] = bandit
+        if rng.random() < success_probs[bandit]:
+            reward_log[t] = 1
+            alpha_totals[bandit] += alpha_damping
+        else:
+            reward_log[t] = 0
+            beta_totals[bandit] += beta_damping
+
+
+def _run_trials_kernel(success_probs: np.ndarray,
+                       alpha_priors: np.ndarray,
+                       beta_priors: np.ndarray,
+                       alpha_damping: float,
+                       beta_damping: float,
+                       optimistic: bool,
+                       optimistic_threshold: float,
+                       rngs: list,
+                       choice_logs: np.ndarray,
+                       reward_logs: np.ndarray) -> None:
+    """
+    Runs independent TS experiments in parallel, one per row of the output arrays.
+    Each trial starts from the prior parameters and uses its own random number generator.
+    :param success_probs: the success probability of each bandit
+    :param alpha_priors: the alpha parameter of the prior distribution of each bandit
+    :param beta_priors: the beta parameter of the prior distribution of each bandit
+    :param alpha_damping: the increment of alpha after each success
+    :param beta_damping: the increment of beta after each failure
+    :param optimistic: whether to use an optimistic TS strategy
+    :param optimistic_threshold: the lower bound for sampling in an optimistic strategy
+    :param rngs: the random number generator of each trial
+    :param choice_logs: output array of shape (n_trials, steps), the bandit drawn at each step
+    :param reward_logs: output array of shape (n_trials, steps), the reward (0/1) obtained at each step
+    """
+    for trial in numba.prange(choice_logs.shape[0]):
+        # prange indices are unsigned, while typed lists are indexed by signed integers
+        _run_kernel(success_probs, alpha_priors.copy(), beta_priors.copy(),
+                    alpha_damping, beta_damping, optimistic, optimistic_threshold,
+                    rngs[np.int64(trial)], choice_logs[trial], reward_logs[trial])
+
+
+if numba is not None:
+    # the single-experiment kernel releases the GIL, so experiments of different instances
+    # can run in concurrent threads; the parallel kernel keeps it, since numba's default
+    # (workqueue) threading layer aborts if two threads launch parallel regions at once
+    _run_kernel = numba.njit(cache=True, fastmath=True, nogil=True)(_run_kernel)
+    _run_trials_kernel = numba.njit(cache=True, parallel=True)(_run_trials_kernel)
+
 
 class Thompson:
 
@@ -18,7 +120,8 @@ class Thompson:
                  alpha_init: [float] = None,
                  beta_init: [float] = None,
                  optimistic: bool = None,
-                 optimistic_threshold: float = None
+                 optimistic_threshold: float = None,
+                 seed: int = None
                  ) -> None:
         """
         :param success_probs: an array of floats in the [0, 1] interval, the success probability of each bandit
@@ -32,100 +135,197 @@ class Thompson:
         :param optimistic: whether to use an optimistic TS strategy, whereby a lower bound is put on sampling
             (defaults to False)
         :param optimistic_threshold: the lower bound for sampling in an optimistic strategy (defaults to 1.e-6)
+        :param seed: the seed of the random number generator (optional, defaults to fresh entropy)
         """
 
         # test validity of input variables
-        try:
-            self.n_bandits = len(success_probs)
-        except TypeError:
-            print("Success probabilities must be passed in array")
-        self.success_probs = np.array(success_probs)
+        (self.success_probs, self.steps, self.alpha_damping, self.beta_damping,
+         self.alpha_init, self.beta_init, self.optimistic, self.optimistic_threshold) = self._validate(
+            success_probs, steps, alpha_damping, beta_damping,
+            alpha_init, beta_init, optimistic, optimistic_threshold)
+        self.n_bandits = len(self.success_probs)
         self.max_prob = self.success_probs.max()
+        # regret of drawing from each bandit
+        self.regret_per_arm = self.max_prob - self.success_probs
+
+        # random number generator of this instance
+        self.rng = np.random.default_rng(seed)
+
+        # parameters of the posterior Beta distribution of each bandit
+        self.alpha_totals = None
+        self.beta_totals = None
+        # samples of the posterior distributions drawn in advance, the next one to use,
+        # and the bandits whose posterior has changed since they were drawn
+        self._beta_cache = None
+        self._beta_cache_index = None
+        self._stale_bandits = None
+        self.reset_posteriors()
+
+        # smallest integer type able to index the bandits, for the choice logs
+        self.choice_dtype = np.int16 if self.n_bandits <= np.iinfo(np.int16).max else np.int32
+
+        # variables storing the bandit drawn at each step, and whether it gave a reward
+        self.choice_log = None
+        self.reward_log = None
+        # variables storing the global progression of the experiment
+        self.total_rewards = None
+        self.regret = None
+        # variables storing the progression of many independent experiments
+        self.trials_total_rewards = None
+        self.trials_regret = None
+
+    @staticmethod
+    def _validate(success_probs: [float],
+                  steps: int,
+                  alpha_damping: float,
+                  beta_damping: float,
+                  alpha_init: [float],
+                  beta_init: [float],
+                  optimistic: bool,
+                  optimistic_threshold: float) -> tuple:
+        """
+        Function to test the validity of the input variables of the class and fill in their defaults
+        (see the class constructor for their meaning)
+        :return: the input variables, with arrays converted to numpy float arrays
+        """
         try:
-            assert np.all(self.success_probs >= 0)
-            assert np.all(self.success_probs <= 1)
-        except AssertionError:
-            print("Elements of array of success probabilities must belong to [0, 1] interval.")
+            n_bandits = len(success_probs)
+        except TypeError:
+            raise TypeError("Success probabilities must be passed in array") from None
+        if n_bandits == 0:
+            raise ValueError("Array of success probabilities must not be empty.")
+        success_probs = np.array(success_probs, dtype=np.float64)
+        if np.any(success_probs < 0) or np.any(success_probs > 1):
+            raise ValueError("Elements of array of success probabilities must belong to [0, 1] interval.")
 
         if steps is None:
-            self.steps = 1000
-        else:
-            try:
-                assert ((steps == int(steps)) & (steps > 0))
-            except AssertionError:
-                print("Number of steps must be positive integer")
-            self.steps = steps
+            steps = 1000
+        elif steps != int(steps) or steps <= 0:
+            raise ValueError("Number of steps must be positive integer")
 
         if alpha_damping is None:
-            self.alpha_damping = 1
-        else:
-            try:
-                assert ((alpha_damping >= 0) & (alpha_damping <= 1))
-            except AssertionError:
-                print("alpha_damping must belong to [0, 1] interval.")
-            self.alpha_damping = alpha_damping
+            alpha_damping = 1
+        elif not 0 <= alpha_damping <= 1:
+            raise ValueError("alpha_damping must belong to [0, 1] interval.")
 
         if beta_damping is None:
-            self.beta_damping = 1
-        else:
-            try:
-                assert ((beta_damping >= 0) & (beta_damping <= 1))
-            except AssertionError:
-                print("beta_damping must belong to [0, 1] interval.")
-            self.beta_damping = beta_damping
+            beta_damping = 1
+        elif not 0 <= beta_damping <= 1:
+            raise ValueError("beta_damping must belong to [0, 1] interval.")
 
         if alpha_init is None:
-            self.alpha_init = np.ones_like(success_probs)
+            alpha_init = np.ones(n_bandits)
         else:
-            try:
-                assert len(alpha_init) == self.n_bandits
-            except AssertionError:
-                print("Arrays alpha_init and success_probs must have equal length")
-            try:
-                assert np.all(alpha_init >= 0)
-            except AssertionError:
-                print("Elements of array alpha_init must be >= 0.")
-            self.alpha_init = alpha_init
+            alpha_init = np.array(alpha_init, dtype=np.float64)
+            if len(alpha_init) != n_bandits:
+                raise ValueError("Arrays alpha_init and success_probs must have equal length")
+            if np.any(alpha_init < 0):
+                raise ValueError("Elements of array alpha_init must be >= 0.")
 
         if beta_init is None:
-            self.beta_init = np.ones_like(success_probs)
+            beta_init = np.ones(n_bandits)
         else:
-            try:
-                assert len(beta_init) == self.n_bandits
-            except AssertionError:
-                print("Arrays beta_init and success_probs must have equal length")
-            try:
-                assert np.all(beta_init >= 0)
-            except AssertionError:
-                print("Elements of array beta_init must be >= 0.")
-            self.beta_init = beta_init
+            beta_init = np.array(beta_init, dtype=np.float64)
+            if len(beta_init) != n_bandits:
+                raise ValueError("Arrays beta_init and success_probs must have equal length")
+            if np.any(beta_init < 0):
+                raise ValueError("Elements of array beta_init must be >= 0.")
 
         if optimistic is None:
-            self.optimistic = False
+            optimistic = False
+        elif not isinstance(optimistic, bool):
+            raise TypeError("parameter optimistic must be True / False")
+
+        if optimistic_threshold is None:
+            optimistic_threshold = 1.e-6
+        elif not 0 <= optimistic_threshold < 1:
+            raise ValueError("optimistic_threshold must belong to [0, 1[ interval.")
+
+        return (success_probs, int(steps), alpha_damping, beta_damping,
+                alpha_init, beta_init, optimistic, optimistic_threshold)
+
+    def _per_step(self,
+                  weights: np.ndarray) -> np.ndarray:
+        """
+        Function to expand a per-step quantity into an array with one row per bandit,
+        zero everywhere except at the bandit drawn at each step
+        :param weights: an array of length steps, the value to place at each step
+        :return: an array of shape (n_bandits, steps)
+        """
+        expanded = np.zeros((self.n_bandits, len(self.choice_log)))
+        expanded[self.choice_log, np.arange(len(self.choice_log))] = weights
+        return expanded
+
+    @property
+    def choices(self) -> np.ndarray:
+        """
+        The choice of bandit at each step, as an array of shape (n_bandits, steps)
+        """
+        if self.reward_log is None:
+            return None
+        return self._per_step(1)
+
+    @property
+    def rewards(self) -> np.ndarray:
+        """
+        The (damped) reward obtained by each bandit at each step, as an array of shape (n_bandits, steps)
+        """
+        if self.reward_log is None:
+            return None
+        return self._per_step(self.reward_log * self.alpha_damping)
+
+    @property
+    def penalties(self) -> np.ndarray:
+        """
+        The (damped) penalty obtained by each bandit at each step, as an array of shape (n_bandits, steps)
+        """
+        if self.reward_log is None:
+            return None
+        return self._per_step((1 - self.reward_log) * self.beta_damping)
+
+    @property
+    def cumsum_rewards(self) -> np.ndarray:
+        """
+        The cumulative rewards gathered by each bandit over time
+        """
+        if self.reward_log is None:
+            return None
+        # accumulate in place, reading and writing the (n_bandits, steps) array only once
+        rewards = self.rewards
+        return np.cumsum(rewards, axis=1, out=rewards)
+
+    @property
+    def cumsum_penalties(self) -> np.ndarray:
+        """
+        The cumulative penalties gathered by each bandit over time
+        """
+        if self.reward_log is None:
+            return None
+        penalties = self.penalties
+        return np.cumsum(penalties, axis=1, out=penalties)
+
+    def reset_posteriors(self) -> None:
+        """
+        Function to reset the posterior distribution of each bandit to its prior
+        """
+        self.alpha_totals = self.alpha_init + 1.0
+        self.beta_totals = self.beta_init + 1.0
+        self._beta_cache_index = BETA_CACHE_SIZE
+        self._stale_bandits = set()
+
+    def update_posterior(self,
+                         k: int,
+                         reward: int) -> None:
+        """
+        Function to update the posterior distribution of bandit k (and no other) after drawing from it
+        :param k: the bandit drawn
+        :param reward: the reward (0/1) obtained
+        """
+        if reward == 1:
+            self.alpha_totals[k] += self.alpha_damping
         else:
-            try:
-                assert isinstance(optimistic, bool)
-            except AssertionError:
-                raise AssertionError('parameter optimistic must be True / False')
-            self.optimistic = optimistic
-            if optimistic_threshold is None:
-                self.optimistic_threshold = 1.e-6
-            else:
-                try:
-                    assert ((optimistic_threshold >= 0) & (optimistic_threshold < 1))
-                except AssertionError:
-                    print("optimistic_threshold must belong to [0, 1[ interval.")
-                self.optimistic_threshold = optimistic_threshold
-
-        # variables storing the progression of rewards and penalties of each bandit
-        self.rewards = None
-        self.penalties = None
-        # variables storing the global progression of the experiment
-        self.choices = None
-        self.cumsum_rewards = None
-        self.cumsum_penalties = None
-        self.total_rewards = None
-        self.regret = None
+            self.beta_totals[k] += self.beta_damping
+        self._stale_bandits.add(k)
 
     def draw_bandit(self,
                     k: int) -> (int, int):
@@ -135,29 +335,69 @@ class Thompson:
         :param k: the bandit to be drawn
         :return: the reward (0/1) and the regret
         """
-        reward = np.random.binomial(1, self.success_probs[k])
-        regret = self.max_prob - self.success_probs[k]
+        reward = int(self.rng.random() < self.success_probs[k])
+        regret = self.regret_per_arm[k]
 
         return reward, regret
 
+    def _sample_posteriors(self,
+                           n_samples: int) -> np.ndarray:
+        """
+        Function to sample the posterior distribution of each bandit,
+        with its normal approximation when both its parameters exceed NORMAL_APPROX_THRESHOLD
+        :param n_samples: the number of samples of each distribution
+        :return: an array of shape (n_samples, n_bandits)
+        """
+        a, b = self.alpha_totals, self.beta_totals
+        samples = np.empty((n_samples, self.n_bandits))
+        approx = np.minimum(a, b) > NORMAL_APPROX_THRESHOLD
+        exact = ~approx
+        if approx.any():
+            a_n, b_n = a[approx], b[approx]
+            samples[:, approx] = a_n / (a_n + b_n) + np.sqrt(a_n * b_n / ((a_n + b_n) ** 2 * (a_n + b_n + 1))) * \
+                self.rng.standard_normal((n_samples, len(a_n)))
+            np.clip(samples, 0., 1., out=samples)
+        if exact.any():
+            samples[:, exact] = self.rng.beta(a[exact], b[exact], size=(n_samples, exact.sum()))
+        return samples
+
+    def _sample_posterior(self,
+                          k: int) -> float:
+        """
+        Function to sample the posterior distribution of bandit k,
+        with its normal approximation when both its parameters exceed NORMAL_APPROX_THRESHOLD
+        :param k: the bandit
+        :return: the sample
+        """
+        a, b = self.alpha_totals[k], self.beta_totals[k]
+        if min(a, b) > NORMAL_APPROX_THRESHOLD:
+            theta = a / (a + b) + np.sqrt(a * b / ((a + b) ** 2 * (a + b + 1))) * self.rng.standard_normal()
+            return min(max(theta, 0.), 1.)
+        return self.rng.beta(a, b)
+
     def sampling(self) -> int:
         """
         Function to pick which bandit to draw from with TS
         :return: the bandit to draw
         """
-        # randomly sample posterior distributions for each bandit
-        thetas = [np.random.beta(1 + alpha_init + alpha,
-                                 1 + beta_init + beta)
-                  for (alpha_init, alpha, beta_init, beta)
-                  in zip(self.alpha_init, self.rewards.sum(axis=1),
-                         self.beta_init, self.penalties.sum(axis=1))]
-
-        # introducing caution, by never allowing sampling to go below a minimum threshold = 0.1
-        if self.optimistic:
-            thetas = [max(t, self.optimistic_threshold) for t in thetas]
+        # randomly sample posterior distributions for each bandit, BETA_CACHE_SIZE steps at a time
+        if self._beta_cache_index == BETA_CACHE_SIZE:
+            self._beta_cache = self._sample_posteriors(BETA_CACHE_SIZE)
+            self._beta_cache_index = 0
+            self._stale_bandits.clear()
+        thetas = self._beta_cache[self._beta_cache_index]
+        self._beta_cache_index += 1
+        # samples drawn in advance are no longer valid for bandits updated since
+        for k in self._stale_bandits:
+            thetas[k] = self._sample_posterior(k)
 
         # pick bandit with max probability
-        k = np.argmax(thetas)
+        k = int(thetas.argmax())
+
+        # introducing caution, by never allowing sampling to go below a minimum threshold:
+        # clipping only changes the pick when all samples are below it (they then tie, and the first wins)
+        if self.optimistic and thetas[k] <= self.optimistic_threshold:
+            k = 0
 
         return k
 
@@ -166,30 +406,76 @@ class Thompson:
         Main function to run the experiment and store its results
         """
         # reset all variables to zero
-        self.rewards = np.zeros((self.n_bandits, self.steps))
-        self.penalties = np.zeros((self.n_bandits, self.steps))
-        # variables storing the global progression of the experiment
-        self.choices = np.zeros((self.n_bandits, self.steps))
-        self.total_rewards = np.zeros(self.steps)
-        self.regret = np.zeros(self.steps)
-
-        # start experiment
-        for t in range(self.steps):
-            # pick a bandit, record the choice
-            bandit = self.sampling()
-            self.choices[bandit, t] = 1
-            # draw from it
-            reward, regret = self.draw_bandit(bandit)
-            # update distribution of drawn bandit (and no other)
-            if reward == 1:
-                self.rewards[bandit, t] += 1 * self.alpha_damping
-            else:
-                self.penalties[bandit, t] += 1 * self.beta_damping
-            # keep track of global progression of experiment
-            self.regret[t] = regret
-
-        # cumulative rewards and penalties gathered by each bandit over time
-        self.cumsum_rewards = self.rewards.cumsum(axis=1)
-        self.cumsum_penalties = self.penalties.cumsum(axis=1)
-        # cumulative simulation rewards over time (all bandits)
-        self.total_rewards = self.cumsum_rewards.sum(axis=0)
+        self.reset_posteriors()
+        self.choice_log = np.empty(self.steps, dtype=self.choice_dtype)
+        self.reward_log = np.empty(self.steps, dtype=np.int8)
+        if numba is not None:
+            # run the whole experiment in compiled code
+            _run_kernel(self.success_probs, self.alpha_totals, self.beta_totals,
+                        float(self.alpha_damping), float(self.beta_damping),
+                        self.optimistic, float(self.optimistic_threshold),
+                        self.rng,
+                        self.choice_log, self.reward_log)
+        else:
+            # draw all the uniforms deciding the rewards at once (only one bandit is drawn per step)
+            uniforms = self.rng.random(self.steps)
+
+            # bind attributes and methods to locals, avoiding their lookup at each step
+            sampling = self.sampling
+            success_probs = self.success_probs
+            alpha_totals = self.alpha_totals
+            beta_totals = self.beta_totals
+            alpha_damping = self.alpha_damping
+            beta_damping = self.beta_damping
+            choice_log = self.choice_log
+            reward_log = self.reward_log
+            stale_bandits = self._stale_bandits
+
+            # start experiment
+            for t in range(self.steps):
+                # pick a bandit, record the choice
+                bandit = sampling()
+                choice_log[t] = bandit
+                # draw from it, and update its distribution (and no other)
+                if uniforms[t] < success_probs[bandit]:
+                    reward_log[t] = 1
+                    alpha_totals[bandit] += alpha_damping
+                else:
+                    reward_log[t] = 0
+                    beta_totals[bandit] += beta_damping
+                stale_bandits.add(bandit)
+
+        # regret over time, and cumulative simulation rewards over time (all bandits)
+        self.regret = self.regret_per_arm[self.choice_log]
+        self.total_rewards = np.cumsum(self.reward_log, dtype=np.float64) * self.alpha_damping
+
+    def run_experiments(self,
+                        n_trials: int) -> None:
+        """
+        Function to run many independent experiments and store the progression of each one,
+        in parallel over the available cores if numba is installed
+        :param n_trials: the number of experiments to run
+        """
+        # the trials start from the priors, leaving the posteriors and logs of this instance untouched
+        alpha_priors = self.alpha_init + 1.0
+        beta_priors = self.beta_init + 1.0
+        choice_logs = np.empty((n_trials, self.steps), dtype=self.choice_dtype)
+        reward_logs = np.empty((n_trials, self.steps), dtype=np.int8)
+        # each trial draws from its own generator, seeded from the one of this instance
+        seed = self.rng.integers(2 ** 31)
+        rngs = [np.random.default_rng(seed + trial) for trial in range(n_trials)]
+
+        if numba is not None:
+            _run_trials_kernel(self.success_probs, alpha_priors, beta_priors,
+                               float(self.alpha_damping), float(self.beta_damping),
+                               self.optimistic, float(self.optimistic_threshold),
+                               numba.typed.List(rngs), choice_logs, reward_logs)
+        else:
+            for trial in range(n_trials):
+                _run_kernel(self.success_probs, alpha_priors.copy(), beta_priors.copy(),
+                            float(self.alpha_damping), float(self.beta_damping),
+                            self.optimistic, float(self.optimistic_threshold),
+                            rngs[trial], choice_logs[trial], reward_logs[trial])
+
+        self.trials_regret = self.regret_per_arm[choice_logs]
+        self.trials_total_rewards = np.cumsum(reward_logs, axis=1, dtype=np.float64) * self.alpha_damping